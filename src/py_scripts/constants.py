@@ -0,0 +1,5 @@
+import pathlib
+
+# defaults plot values shared by the plotting scripts
+OUTPUT_DIR = pathlib.Path('./output/').resolve()
+PLOT_EXT = 'svg'
@@ -1,11 +1,35 @@
+import copy
+import functools
+import itertools
 import os
+import pathlib
 import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
+import matplotlib
 import numpy as np
-from matplotlib import pyplot as plt
 
-output_dir = './output/'
-plot_ext = 'svg'
+if os.environ.get("IZ_HEADLESS"):
+    # Render off-screen for batch runs, skipping GUI backend initialization.
+    matplotlib.use("Agg")
+
+from matplotlib import pyplot as plt  # noqa: E402
+from matplotlib.collections import LineCollection  # noqa: E402
+from matplotlib.colors import to_rgba_array  # noqa: E402
+from matplotlib.lines import Line2D  # noqa: E402
+
+from constants import OUTPUT_DIR, PLOT_EXT  # noqa: E402
+
+_RE_BITSIZE = re.compile(r"Target Bit Size:\s*(\d+)")
+# A whole section separator line, i.e. any line starting with "-----".
+_RE_SEPARATOR = re.compile(r"^[ \t]*-----.*$", re.MULTILINE)
+
+# Parsed results are cached next to the results file with this suffix.
+_CACHE_SUFFIX = ".cache.npz"
+# Bump when the parsing or the cache layout changes to drop stale sidecars.
+_CACHE_VERSION = 2
 
 
 def read_results(filename: str):
@@ -28,43 +52,90 @@ def read_results(filename: str):
     Returns:
         bit_size (int)
         results: a list of dictionaries with keys:
-                 algorithm, cores, times (list of individual time measurements),
+                 algorithm, cores, times (array of individual time measurements),
                  avg_time.
     """
-    filepath = os.path.join(output_dir, f"{filename}.txt")
+    filepath = OUTPUT_DIR / f"{filename}.txt"
+    # Copy the cached results so callers can't mutate them.
+    return copy.deepcopy(
+        _read_results_cached(filepath, filepath.stat().st_mtime))
+
+
+@functools.lru_cache(maxsize=32)
+def _read_results_cached(filepath: pathlib.Path, mtime: float):
+    """Parse a prime generation results file, cached by (filepath, mtime)."""
+    cache_path = filepath.with_name(filepath.name + _CACHE_SUFFIX)
+    if cache_path.exists() and cache_path.stat().st_mtime >= mtime:
+        try:
+            return _load_results_cache(cache_path)
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+            pass  # damaged or outdated cache, parse again and rewrite it
+
     with open(filepath, 'r') as file:
-        lines = [line.strip() for line in file.readlines()]
+        text = file.read()
 
-    # The first non-empty line is expected to specify the target bit size.
-    bit_size = None
-    for line in lines:
-        if line.startswith("Target Bit Size:"):
-            m = re.match(r"Target Bit Size:\s*(\d+)", line)
-            if m:
-                bit_size = int(m.group(1))
-            break
+    # The first "Target Bit Size" line specifies the target bit size.
+    m = _RE_BITSIZE.search(text)
+    bit_size = int(m.group(1)) if m else None
 
+    # Sections are separated by lines starting with "-----".
     results = []
-    section_lines = []
-    for line in lines:
-        # Sections are separated by lines starting with "-----"
-        if line.startswith("-----"):
-            if section_lines:
-                r = parse_section(section_lines)
-                if r:
-                    results.append(r)
-                section_lines = []
-        else:
-            if line:
-                section_lines.append(line)
-    if section_lines:
-        r = parse_section(section_lines)
+    for chunk in _RE_SEPARATOR.split(text):
+        r = parse_section([line.strip() for line in chunk.splitlines()])
         if r:
             results.append(r)
 
+    _save_results_cache(cache_path, bit_size, results)
     return bit_size, results
 
 
+def _save_results_cache(cache_path: pathlib.Path, bit_size, results):
+    """Write parsed results to an .npz sidecar; skipped if not writable."""
+    lengths = np.array([res["times"].size for res in results], dtype=np.int64)
+    times = (np.concatenate([res["times"] for res in results])
+             if results else np.empty(0))
+    try:
+        # Write to a unique temporary file first so readers never see a
+        # partial cache, even with concurrent writers.
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent,
+                                        prefix=cache_path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file,
+                         version=_CACHE_VERSION,
+                         bit_size=-1 if bit_size is None else bit_size,
+                         algorithms=np.array([res["algorithm"] for res in results], dtype=str),
+                         cores=np.array([res["cores"] for res in results], dtype=np.int64),
+                         lengths=lengths,
+                         times=times,
+                         avg_time=np.array([res["avg_time"] for res in results], dtype=np.float64))
+            # mkstemp creates the file as 0600; apply the usual umask-based mode.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def _load_results_cache(cache_path: pathlib.Path):
+    """Read results written by _save_results_cache."""
+    if cache_path.stat().st_size == 0:
+        raise EOFError(f"empty results cache: {cache_path}")
+    with open(cache_path, 'rb') as file, np.load(file) as cache:
+        if int(cache["version"]) != _CACHE_VERSION:
+            raise ValueError(f"outdated results cache: {cache_path}")
+        bit_size = int(cache["bit_size"])
+        times = np.split(cache["times"], np.cumsum(cache["lengths"])[:-1])
+        results = [{"algorithm": str(algo), "cores": int(cores), "times": t, "avg_time": avg}
+                   for algo, cores, t, avg in zip(cache["algorithms"], cache["cores"],
+                                                  times, cache["avg_time"])]
+    return (None if bit_size < 0 else bit_size), results
+
+
 def parse_section(lines):
     """
     Parse one section from the results file.  
@@ -72,15 +143,14 @@ def parse_section(lines):
        - Algorithm: <algorithm info>
        - Cores Number: <value>
        - Time Results (seconds): [<time1>, <time2>, ...]
-       - Average Time: <value> seconds
-    Other lines (e.g. "Prime Result ..." lines) are ignored.
+    Other lines (e.g. "Prime Result ..." and "Average Time ..." lines) are
+    ignored; the average time is computed from the time measurements.
 
-    Returns a dict with keys: algorithm, cores, times (list), avg_time.
+    Returns a dict with keys: algorithm, cores, times (ndarray), avg_time.
     """
     algorithm = None
     cores = None
-    times = []
-    avg_time = None
+    times = np.empty(0)
 
     for line in lines:
         if line.startswith("Algorithm:"):
@@ -92,19 +162,16 @@ def parse_section(lines):
                 cores = None
         elif line.startswith("Time Results (seconds):"):
             # Extract the list inside the brackets (e.g. [0.008732, 0.008613, ...])
-            m = re.search(r"\[(.*?)\]", line)
-            if m:
-                times_str = m.group(1)
-                times = [float(x.strip())
-                         for x in times_str.split(",") if x.strip()]
-        elif line.startswith("Average Time:"):
-            m = re.search(r"([\d.]+)", line)
-            if m:
-                avg_time = float(m.group(1))
+            lb = line.find('[')
+            rb = line.rfind(']')
+            if lb != -1 and rb > lb:
+                # Skip empty tokens; np.fromstring would read them as -1.
+                tokens = [x for x in line[lb + 1:rb].split(",") if x.strip()]
+                times = np.array(tokens, dtype=np.float64)
         # Any other lines (e.g. "Prime Result ...") are skipped.
 
-    if algorithm is not None and cores is not None and times and avg_time is not None:
-        return {"algorithm": algorithm, "cores": cores, "times": times, "avg_time": avg_time}
+    if algorithm is not None and cores is not None and times.size:
+        return {"algorithm": algorithm, "cores": cores, "times": times, "avg_time": times.mean()}
     else:
         return None
 
@@ -117,7 +184,25 @@ def plot_prime_gen_results(filename: str, save: bool = False):
     showing the algorithm name and cores number.
     """
     bit_size, results = read_results(filename)
+    _plot_prime_gen_results(filename, bit_size, results, save)
+
+
+def plot_many(filenames, save: bool = True):
+    """
+    Plot several prime generation results files.
+    Files are parsed in parallel worker processes, while plotting stays
+    sequential in the main process.
+    """
+    filenames = list(filenames)
+    with ProcessPoolExecutor() as executor:
+        parsed = list(executor.map(read_results, filenames))
 
+    for filename, (bit_size, results) in zip(filenames, parsed):
+        _plot_prime_gen_results(filename, bit_size, results, save)
+
+
+def _plot_prime_gen_results(filename: str, bit_size, results, save: bool):
+    """Plot already parsed prime generation results, see plot_prime_gen_results."""
     fig, ax = plt.subplots(figsize=(10, 6))
     ax.set_title(f"Prime Generation Times (Target Bit Size: {bit_size})")
     ax.set_xlabel("Test Round")
@@ -130,34 +215,59 @@ def plot_prime_gen_results(filename: str, save: bool = False):
     markers = ['o', 's', 'd', '^', 'v', 'x']
     colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
-    for idx, res in enumerate(results):
-        algo = res["algorithm"]
-        cores = res["cores"]
-        times = res["times"]
-        avg_time = res["avg_time"]
-        x_vals = np.arange(1, len(times) + 1)
-
-        color = colors[idx % len(colors)]
-        marker = markers[idx % len(markers)]
-
-        # Plot individual time measurements.
-        ax.plot(x_vals, times, marker=marker, linestyle='solid', color=color,
-                label=f"{algo} (cores: {cores})")
+    # Colors and markers cycle independently, as with idx % len(...).
+    styles = list(itertools.islice(
+        zip(itertools.cycle(colors), itertools.cycle(markers)), len(results)))
+    segments = [np.column_stack([np.arange(1, res["times"].size + 1), res["times"]])
+                for res in results]
+
+    # Plot individual time measurements of all sections as one collection,
+    # rasterized so dense series are embedded as one image rather than a
+    # path per marker.
+    lines = LineCollection(segments, colors=[color for color, _ in styles],
+                           linestyle='solid', rasterized=True)
+    ax.add_collection(lines)
+
+    # Markers can't vary within a scatter call, so draw one per marker shape.
+    for marker in dict.fromkeys(marker for _, marker in styles):
+        idx = [i for i, (_, m) in enumerate(styles) if m == marker]
+        points = np.concatenate([segments[i] for i in idx])
+        point_colors = np.repeat(to_rgba_array([styles[i][0] for i in idx]),
+                                 [len(segments[i]) for i in idx], axis=0)
+        ax.scatter(points[:, 0], points[:, 1], color=point_colors, marker=marker,
+                   zorder=lines.get_zorder() + 1, rasterized=True)
+
+    # Proxy artists for the legend, one per section.
+    handles = []
+    for res, (color, marker) in zip(results, styles):
+        handles.append(Line2D([], [], color=color, marker=marker,
+                              label=f"{res['algorithm']} (cores: {res['cores']})"))
         # Draw a horizontal dashed line indicating the average time.
-        # ax.hlines(avg_time, x_vals[0], x_vals[-1], colors=color, linestyles='dashed')
+        # ax.hlines(res["avg_time"], 1, res["times"].size, colors=color, linestyles='dashed')
 
-    ax.legend()
+    ax.autoscale()
+    ax.legend(handles=handles)
     plt.tight_layout()
-    plt.show()
+    if not save or os.environ.get("IZ_SHOW"):
+        plt.show()
 
     if save:
-        save_plot_figure(fig, output_dir, filename)
+        save_plot_figure(fig, OUTPUT_DIR, filename)
+        plt.close(fig)
 
 
 def save_plot_figure(fig, dir, filename):
     """Save the plot in SVG format in the default output directory."""
-    filepath = os.path.join(dir, f"{filename}.{plot_ext}")
-    fig.savefig(filepath, format=plot_ext)
+    filepath = pathlib.Path(dir) / f"{filename}.{PLOT_EXT}"
+    if os.environ.get("IZ_CAIRO"):
+        # The C cairo writer (needs pycairo) is faster for dense figures, but
+        # renders at a fixed 72 dpi and draws rasterized artists as vectors.
+        fig.savefig(filepath, format=PLOT_EXT, bbox_inches="tight",
+                    backend="cairo")
+    else:
+        # Omit the timestamp so re-saving an unchanged figure yields identical bytes.
+        fig.savefig(filepath, format=PLOT_EXT, dpi=100, bbox_inches="tight",
+                    metadata={"Date": None})
     print(f"Figure saved as {filepath}")
 
 
@@ -167,8 +277,27 @@ def iZ(x: int, i: int) -> int:
     return 6 * x + i
 
 
+def iZ_vec(x: np.ndarray, i: int) -> np.ndarray:
+    """Vectorized iZ: 6x + i for every x in the array."""
+    assert i in [-1, 1]  # i must be -1 or 1
+    x = np.asarray(x)
+    assert (x > 0).all()  # x must be positive
+    return 6 * x + i
+
+
+def iZ_range(start: int, stop: int, i: int) -> np.ndarray:
+    """Return iZ(x, i) for x in [start, stop), computed in place."""
+    assert i in [-1, 1]  # i must be -1 or 1
+    assert start > 0  # x must be positive
+    assert stop > start  # the range must not be empty
+    out = np.arange(start, stop, dtype=np.int64)
+    out *= 6
+    out += i
+    return out
+
+
 if __name__ == '__main__':
-    # plot_prime_gen_results("random_prime_results_20250226103248", save=True)
-    # plot_prime_gen_results("random_prime_results_20250226112408", save=True)
-    # plot_prime_gen_results("random_prime_results_20250226112841", save=True)
+    # plot_many(["random_prime_results_20250226103248",
+    #            "random_prime_results_20250226112408",
+    #            "random_prime_results_20250226112841"], save=True)
     plot_prime_gen_results("random_prime_results_20250226114627", save=True)
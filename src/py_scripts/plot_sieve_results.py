@@ -1,17 +1,34 @@
+import copy
+import functools
 import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
 
+import matplotlib
 import numpy as np
-from matplotlib import pyplot as plt
 
-# defaults plot values
-output_dir = './output/'
-plot_ext = 'svg'
+if os.environ.get("IZ_HEADLESS"):
+    # Render off-screen for batch runs, skipping GUI backend initialization.
+    matplotlib.use("Agg")
+
+from matplotlib import pyplot as plt  # noqa: E402
+
+from constants import OUTPUT_DIR, PLOT_EXT  # noqa: E402
 
 
 # Function to read results from a file
 def read_results(filename: str):
+    filepath = OUTPUT_DIR / f"{filename}.txt"
+    # Copy the cached results so callers can't mutate them.
+    return copy.deepcopy(
+        _read_results_cached(filepath, filepath.stat().st_mtime))
+
+
+@functools.lru_cache(maxsize=32)
+def _read_results_cached(filepath: pathlib.Path, mtime: float):
+    """Parse a sieve results file, cached by (filepath, mtime)."""
     data = {}
-    with open(f"./output/{filename}.txt", 'r') as file:
+    with open(filepath, 'r') as file:
         lines = file.readlines()
 
         # Read the test range from the first line
@@ -36,14 +53,29 @@ def read_results(filename: str):
 # Function to plot the time performance of sieve benchmarking results
 def plot_sieve_results(filename: str, save: bool = False):
     data, base, exponents = read_results(filename)
+    _plot_sieve_results(filename, data, base, exponents, save)
+
+
+# Function to plot several sieve results files, parsing them in parallel
+# worker processes while plotting stays sequential in the main process
+def plot_many(filenames, save: bool = True):
+    filenames = list(filenames)
+    with ProcessPoolExecutor() as executor:
+        parsed = list(executor.map(read_results, filenames))
+
+    for filename, (data, base, exponents) in zip(filenames, parsed):
+        _plot_sieve_results(filename, data, base, exponents, save)
+
+
+def _plot_sieve_results(filename: str, data, base, exponents, save: bool):
     x_values = [base**exp for exp in exponents]
+    x_arr = np.asarray(x_values, dtype=np.float64)
 
     # Normalize the data
     normalized_data = {}
     for algorithm, times in data.items():
-        normalized_times = [(time * 1000) / n for time,
-                            n in zip(times, x_values)]
-        normalized_data[algorithm] = normalized_times
+        normalized_data[algorithm] = (
+            np.asarray(times, dtype=np.float64) * 1000.0) / x_arr
 
     # Plotting the normalized results
     fig, ax = plt.subplots(figsize=(8, 6))
@@ -53,17 +85,13 @@ def plot_sieve_results(filename: str, save: bool = False):
     ax.set_xlabel(f'N')
     ax.set_ylabel('μs/n * 1000')
 
-    x_ticks = np.log10(x_values)
-    all_y = []
+    x_ticks = np.log10(x_arr)
 
-    for _, (algorithm, times) in enumerate(normalized_data.items()):
-        label = algorithm
-        y = times
-        all_y.append(y)
-        ax.plot(x_ticks, y, label=label, marker='o')
+    for algorithm, times in normalized_data.items():
+        ax.plot(x_ticks, times, label=algorithm, marker='o')
 
     # Set y ticks
-    max_y = max([max(y) for y in all_y])
+    max_y = np.max(np.stack(list(normalized_data.values())))
     ax.set_yticks(np.arange(0, max_y + 1, 1))
 
     # Set x ticks
@@ -72,17 +100,27 @@ def plot_sieve_results(filename: str, save: bool = False):
 
     ax.grid(True)
     plt.legend()
-    plt.show()
+    if not save or os.environ.get("IZ_SHOW"):
+        plt.show()
 
     if save:
-        save_plot_figure(fig, dir=output_dir, filename=filename)
+        save_plot_figure(fig, dir=OUTPUT_DIR, filename=filename)
+        plt.close(fig)
 
 
 # Function to save the plot figure
 def save_plot_figure(fig, dir, filename):
-    """save plot in svg format in the default output_dir"""
-    filepath = os.path.join(dir, f"{filename}.{plot_ext}")
-    fig.savefig(filepath, format=plot_ext)
+    """save plot in svg format in the default OUTPUT_DIR"""
+    filepath = pathlib.Path(dir) / f"{filename}.{PLOT_EXT}"
+    if os.environ.get("IZ_CAIRO"):
+        # The C cairo writer (needs pycairo) is faster for dense figures, but
+        # renders at a fixed 72 dpi and draws rasterized artists as vectors.
+        fig.savefig(filepath, format=PLOT_EXT, bbox_inches="tight",
+                    backend="cairo")
+    else:
+        # Omit the timestamp so re-saving an unchanged figure yields identical bytes.
+        fig.savefig(filepath, format=PLOT_EXT, dpi=100, bbox_inches="tight",
+                    metadata={"Date": None})
     print(f"Figure saved as {filepath}")
 
 
@@ -93,17 +131,19 @@ def plot_complexity(save: bool = False):
     x_values = [10**exp for exp in exponents]
 
     # Calculate complexity functions
-    n_values = x_values
-    log_log_n_values = [np.log(np.log(n)) for n in x_values]
-    print(log_log_n_values)
-    n_log_log_n_values = [n * np.log(np.log(n)) for n in x_values]
-    print(n_log_log_n_values)
-    sqrt_n_values = [n**.5 for n in x_values]
-    print(sqrt_n_values)
-    log_n_values = [np.log(n) for n in x_values]
-    print(log_n_values)
-    n_div_log_log_n_values = [n / np.log(np.log(n)) for n in x_values]
-    print(n_div_log_log_n_values)
+    n_values = np.asarray(x_values, dtype=np.float64)
+    log_n_values = np.log(n_values)
+    log_log_n_values = np.log(log_n_values)
+    n_log_log_n_values = n_values * log_log_n_values
+    sqrt_n_values = np.sqrt(n_values)
+    n_div_log_log_n_values = n_values / log_log_n_values
+
+    if __debug__ and os.environ.get("IZ_DEBUG"):
+        print(log_log_n_values)
+        print(n_log_log_n_values)
+        print(sqrt_n_values)
+        print(log_n_values)
+        print(n_div_log_log_n_values)
 
     # Create plot
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -129,10 +169,12 @@ def plot_complexity(save: bool = False):
     ax.set_yscale('log')
 
     plt.tight_layout()
-    plt.show()
+    if not save or os.environ.get("IZ_SHOW"):
+        plt.show()
 
     if save:
-        save_plot_figure(fig, dir=output_dir, filename="complexity_functions")
+        save_plot_figure(fig, dir=OUTPUT_DIR, filename="complexity_functions")
+        plt.close(fig)
 
 
 def read_w_op(filename: str):
@@ -147,39 +189,34 @@ def read_w_op(filename: str):
     | ... (more rows)
 
     Returns:
-        data: dict mapping column headers to lists of values.
+        data: dict mapping column headers to numpy arrays of values.
               For example: 
               { "n": [1000, 10000, ...],
                 "Sieve-Eratosthenes": [902, 11958, ...],
                 ... }
     """
-    filepath = os.path.join(output_dir, f"{filename}.txt")
-    data = {}
-    header = None
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            # Remove leading and trailing '|' characters and split by '|'
-            parts = [part.strip() for part in line.strip('|').split('|')]
-            if header is None:
-                header = parts
-                # Initialize lists for each column.
-                for col in header:
-                    data[col] = []
-            else:
-                # Ensure the row has the same number of columns as the header.
-                if len(parts) == len(header):
-                    for i, value in enumerate(parts):
-                        # For the "n" column and algorithm columns, try converting to int.
-                        try:
-                            num = int(value)
-                            data[header[i]].append(num)
-                        except ValueError:
-                            data[header[i]].append(value)
-    return data
+    filepath = OUTPUT_DIR / f"{filename}.txt"
+    # Copy the cached results so callers can't mutate them.
+    return copy.deepcopy(
+        _read_w_op_cached(filepath, filepath.stat().st_mtime))
+
+
+@functools.lru_cache(maxsize=32)
+def _read_w_op_cached(filepath: pathlib.Path, mtime: float):
+    """Parse a sieve_w_op results file, cached by (filepath, mtime)."""
+    with open(filepath, 'r', encoding='utf-8') as file:
+        # Remove leading and trailing '|' characters and split by '|'
+        header = [part.strip()
+                  for part in file.readline().strip().strip('|').split('|')]
+        # Each column's dtype is inferred from its values. The leading '|'
+        # yields an empty first column, so read only the header's columns;
+        # rows with missing columns are skipped with a warning.
+        rows = np.genfromtxt(file, delimiter='|', names=header, dtype=None,
+                             encoding='utf-8', autostrip=True, comments=None,
+                             deletechars='', replace_space=' ', ndmin=1,
+                             usecols=range(1, len(header) + 1),
+                             invalid_raise=False)
+    return {col: rows[col] for col in header}
 
 
 def plot_w_op(filename: str, save: bool = False):
@@ -197,7 +234,7 @@ def plot_w_op(filename: str, save: bool = False):
     # x-axis values are from column "n"
     x_vals = data["n"]
     # Transform n values to log10(n)
-    x_vals_log = [np.log10(n) for n in x_vals]
+    x_vals_log = np.log10(np.asarray(x_vals, dtype=np.float64))
 
     fig, ax = plt.subplots(figsize=(8, 6))
     title = "Normalized Mark-Composite Write Operations W(n)/n"
@@ -213,25 +250,26 @@ def plot_w_op(filename: str, save: bool = False):
 
     for i, algo in enumerate(algorithms):
         if algo in data:
-            y_vals = data[algo]
             # Normalize by dividing each value by corresponding n.
-            normalized = [y / n for y, n in zip(y_vals, x_vals)]
+            normalized = data[algo] / x_vals
             ax.plot(x_vals_log, normalized, marker=markers[algo],
                     color=colors[i % len(colors)],
                     label=algo, linewidth=2)
 
     # Draw a horizontal dashed line at y = 1
-    ax.hlines(1, min(x_vals_log), max(x_vals_log), colors='black',
+    ax.hlines(1, x_vals_log.min(), x_vals_log.max(), colors='black',
               linestyles='dashed', label='n/n = 1')
     # Set x ticks to the log10(n) values and label them as 10^exp
     ax.set_xticks(x_vals_log)
-    ax.set_xticklabels([f"$10^{{{int(np.log10(n))}}}$" for n in x_vals])
+    ax.set_xticklabels([f"$10^{{{exp}}}$" for exp in x_vals_log.astype(int)])
     ax.legend()
     plt.tight_layout()
-    plt.show()
+    if not save or os.environ.get("IZ_SHOW"):
+        plt.show()
 
     if save:
-        save_plot_figure(fig, output_dir, "sieve_w_op")
+        save_plot_figure(fig, OUTPUT_DIR, "sieve_w_op")
+        plt.close(fig)
 
 
 if __name__ == '__main__':